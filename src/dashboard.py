@@ -1,22 +1,265 @@
 # src/dashboard.py
 
+import functools
+import json
+
 import dash
-from dash import html, dcc, dash_table
-from dash.dependencies import Input, Output
+import diskcache
+from dash import html, dcc, dash_table, DiskcacheManager
+from dash.dependencies import Input, Output, State, MATCH
 import pandas as pd
+import polars as pl
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.utils
+from flask_caching import Cache
+from plotly_resampler import FigureResampler
+import pyarrow.parquet as pq
 from pathlib import Path
 
 # ─── 0) Ścieżki bazowe ───────────────────────────────────────────────
 OUTPUT_DIR = Path("../output")   # katalog, w którym parse_log.py wygenerował foldery z runami
 
-# ─── 1) Lista dostępnych runów ───────────────────────────────────────
+BLOCK_SIZE = 10_000              # rozmiar bloku kroków do agregacji
+
+SUCCESS_THRESHOLD = 50           # próg sukcesu — fallback dla starszych runów
+                                 # bez kolumny "success" z parsera
+
+# ─── 1) Aplikacja Dash + cache na dysku ──────────────────────────────
+# Pierwsze wejście na duży run liczy agregacje sekundami — routing działa
+# jako background callback, żeby nie blokować wątku obsługującego żądania
+background_callback_manager = DiskcacheManager(
+    diskcache.Cache("/tmp/dash-cache/background")
+)
+
+app = dash.Dash(__name__, suppress_callback_exceptions=True,
+                background_callback_manager=background_callback_manager)
+
+# Pliki CSV zmieniają się tylko po ponownym uruchomieniu parse_log.py,
+# więc wyniki wczytania + agregacji trzymamy w cache'u na dysku.
+# Wpisy unieważniamy przez mtime plików (w kluczu memoizacji), nie przez TTL.
+cache = Cache(app.server, config={
+    "CACHE_TYPE": "FileSystemCache",
+    "CACHE_DIR": "/tmp/dash-cache",
+    "CACHE_DEFAULT_TIMEOUT": 0,
+})
+
+# ─── 2) Lista dostępnych runów ───────────────────────────────────────
+@functools.lru_cache(maxsize=8)
+def _list_runs(mtime_ns: int):
+    # mtime katalogu w kluczu: nowy/usunięty run zmienia mtime i omija cache
+    return sorted(p.name for p in OUTPUT_DIR.iterdir() if p.is_dir())
+
+
 def list_runs():
     if not OUTPUT_DIR.exists():
         return []
-    return sorted([p.name for p in OUTPUT_DIR.iterdir() if p.is_dir()])
+    return _list_runs(OUTPUT_DIR.stat().st_mtime_ns)
+
+# ─── 3) Wczytanie logów runu + agregacje (memoizowane) ───────────────
+def _data_path(run_folder: Path, stem: str) -> Path:
+    """Ścieżka do danych runu: parquet, a dla starszych runów fallback na CSV."""
+    pq_path = run_folder / f"{stem}.parquet"
+    return pq_path if pq_path.exists() else run_folder / f"{stem}.csv"
+
+
+# Typy dla fallbacku CSV — parquet niesie już typy 32-bit z parsera
+CSV_DTYPES = {
+    "Step": pl.Int32, "Episode": pl.Int32, "Eps": pl.Float32, "lr": pl.Float32,
+    "Ret": pl.Float32, "Last Crash": pl.Int32, "t": pl.Float32, "SF": pl.Float32,
+    "Reward": pl.Float32,
+}
+
+
+# kolumny trainlogu faktycznie używane przez dashboard — reszta
+# (Decision, Eps, lr, SF, Found…) nie musi w ogóle schodzić z dysku
+TRAINLOG_COLUMNS = ["Step", "Episode", "t", "Ret", "Reward", "success"]
+
+
+def _read_table(path: Path, columns=None) -> pl.DataFrame:
+    if path.suffix == ".parquet":
+        if columns is not None:
+            available = set(pq.read_schema(path).names)
+            columns = [c for c in columns if c in available]
+            if "success" in available:
+                # predykat policzony przez parser — Reward zbędny
+                columns = [c for c in columns if c != "Reward"]
+        # memory_map: po pierwszym odczycie strony pliku siedzą w cache'u
+        # systemu i kolejne wczytania nie robią IO
+        return pl.from_arrow(pq.read_table(path, columns=columns, memory_map=True))
+    df = pl.read_csv(path, schema_overrides=CSV_DTYPES)
+    if columns is not None:
+        df = df.select([c for c in columns if c in df.columns])
+    return df
+
+
+@cache.memoize()
+def load_run(run_name: str, mtime_all: float, mtime_best: float):
+    """
+    Wczytuje trainlog i best_results danego runu i liczy wszystkie
+    agregacje blokowe. Parametry mtime_* wchodzą do klucza memoizacji,
+    więc edycja plików na dysku automatycznie unieważnia cache.
+    """
+    run_folder = OUTPUT_DIR / run_name
+
+    df_all  = _read_table(_data_path(run_folder, "trainlog"),
+                          columns=TRAINLOG_COLUMNS)
+    # best_results jest mały — od razu do pandas pod DataTable/nlargest
+    df_best = _read_table(_data_path(run_folder, "best_results")).to_pandas()
+
+    # Kolumnę "success" (int8) liczy parser; starsze runy jej nie mają
+    if "success" not in df_all.columns:
+        df_all = df_all.with_columns(
+            (pl.col("Reward") >= SUCCESS_THRESHOLD).cast(pl.Int8).alias("success")
+        )
+
+    # Metryki globalne
+    total_time_hours = df_all["t"].sum() / 3600
+    if "success" in df_best.columns:
+        total_best_success = int(df_best["success"].sum())
+    else:
+        total_best_success = int((df_best["Reward"] >= SUCCESS_THRESHOLD).sum())
+
+    # Top 100 po Ret: posortowane już przez parser; dla starszych runów
+    # bez top100.parquet liczymy na bieżąco z best_results
+    top_path = run_folder / "top100.parquet"
+    if top_path.exists():
+        df_top = _read_table(top_path).to_pandas()
+    else:
+        df_top = df_best.nlargest(100, "Ret")
+
+    # Dane blokowe (co BLOCK_SIZE kroków): jedna lazy kwerenda polars —
+    # planner fuzuje wszystkie trzy agregacje w jeden wielowątkowy skan
+    blocks = (
+        df_all.lazy()
+              .with_columns(((pl.col("Step") // BLOCK_SIZE) * BLOCK_SIZE)
+                            .alias("Step_block"))
+              .group_by("Step_block")
+              .agg([
+                  pl.col("t").mean().alias("avg_t"),
+                  pl.col("success").sum().alias("successes"),
+                  pl.col("Episode").n_unique().alias("episodes"),
+              ])
+              .sort("Step_block")
+              .collect()
+              .to_pandas()
+    )
 
-# ─── 2) Layout dla pojedynczego runu ─────────────────────────────────
+    avg_t_per_block     = blocks[["Step_block", "avg_t"]]
+    successes_per_block = blocks[["Step_block", "successes"]]
+    episodes_per_block  = blocks[["Step_block", "episodes"]]
+
+    return (df_all, df_top, avg_t_per_block, successes_per_block,
+            episodes_per_block, total_time_hours, total_best_success)
+
+# ─── 3a) Wykresy zserializowane do JSON (memoizowane) ────────────────
+@cache.memoize()
+def build_fig_json(run_name: str, mtime_all: float, mtime_best: float, kind: str) -> str:
+    """
+    Buduje wykres danego rodzaju i zwraca go jako string JSON.
+    Serializacja figury (datetime/float → str) dominuje w callbacku,
+    więc cache'ujemy już zakodowany JSON, a nie obiekt Figure —
+    kolejne nawigacje kopiują gotowy string zamiast kodować od nowa.
+    """
+    (_df_all, _df_top, avg_t_per_block, successes_per_block,
+     episodes_per_block, _tth, _tbs) = load_run(run_name, mtime_all, mtime_best)
+
+    if kind == "avg_t_block":
+        fig = px.line(
+            avg_t_per_block,
+            x="Step_block", y="avg_t",
+            title=f"Średni czas kroku vs blok co {BLOCK_SIZE} kroków",
+            labels={"Step_block": "Krok (blok)", "avg_t": "Średni czas [s]"},
+            markers=True
+        )
+    elif kind == "bar":
+        # grupowany wykres słupkowy bezpośrednio z go.Bar — bez melt
+        # i bez narzutu px na przebudowę ramek per grupa
+        fig = go.Figure([
+            go.Bar(name="successes",
+                   x=successes_per_block["Step_block"],
+                   y=successes_per_block["successes"]),
+            go.Bar(name="episodes",
+                   x=episodes_per_block["Step_block"],
+                   y=episodes_per_block["episodes"]),
+        ])
+        fig.update_layout(
+            barmode="group",
+            title="Sukcesy (Reward ≥100) vs Liczba Epizodów na blok 10 000 kroków",
+            xaxis_title="Krok (blok)",
+            yaxis_title="Liczba",
+            legend_title_text="Metryka",
+        )
+    else:
+        raise ValueError(f"Nieznany rodzaj wykresu: {kind!r}")
+
+    return json.dumps(fig.to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def cached_graph(run_name: str, mtime_all: float, mtime_best: float, kind: str) -> dcc.Graph:
+    """dcc.Graph z figurą odtworzoną z cache'owanego JSON-a."""
+    return dcc.Graph(figure=json.loads(build_fig_json(run_name, mtime_all, mtime_best, kind)))
+
+# ─── 3b) Wykresy pełnoseryjne z downsamplingiem (plotly-resampler) ───
+# Pełne serie (miliony kroków) zostają po stronie serwera; do przeglądarki
+# idzie tylko zagregowane okno (LTTB), a zoom/pan dociąga dane callbackiem.
+# Obiekty FigureResampler żyją w pamięci procesu — a layout może zbudować
+# inny proces (background callback) albo wrócić z sessionStorage po
+# restarcie serwera, więc callback zoomu odtwarza brakującą figurę na
+# żądanie z memoizowanych danych runu (load_run siedzi w cache'u na dysku,
+# wspólnym dla wszystkich procesów).
+_resampler_figs = {}
+
+RESAMPLED_KINDS = {
+    # kind → (kolumna Y, tytuł, etykieta osi Y)
+    "time": ("t",   "Czas kroku (t) vs numer kroku", "Czas [s]"),
+    "ret":  ("Ret", "Ret w czasie",                  "Return"),
+}
+
+
+def _build_resampler_fig(run_name: str, mtime_all: float, mtime_best: float,
+                         kind: str) -> FigureResampler:
+    (df_all, _df_top, _avg, _succ, _epis,
+     _tth, _tbs) = load_run(run_name, mtime_all, mtime_best)
+
+    y_col, title, y_label = RESAMPLED_KINDS[kind]
+    fig = FigureResampler(go.Figure())
+    fig.add_trace(
+        go.Scattergl(name=y_col),
+        hf_x=df_all["Step"].to_numpy(),
+        hf_y=df_all[y_col].to_numpy(),
+    )
+    fig.update_layout(title=title, xaxis_title="Step", yaxis_title=y_label)
+    return fig
+
+
+def _get_resampler_fig(uid: str):
+    """Figura dla uid "run:kind" — z rejestru procesu albo odtworzona."""
+    fig = _resampler_figs.get(uid)
+    if fig is not None:
+        return fig
+
+    run_name, _, kind = uid.rpartition(":")
+    run_folder = OUTPUT_DIR / run_name
+    if kind not in RESAMPLED_KINDS or not run_folder.is_dir():
+        return None
+
+    mtime_all  = _data_path(run_folder, "trainlog").stat().st_mtime
+    mtime_best = _data_path(run_folder, "best_results").stat().st_mtime
+    fig = _build_resampler_fig(run_name, mtime_all, mtime_best, kind)
+    _resampler_figs[uid] = fig
+    return fig
+
+
+def resampled_graph(run_name: str, mtime_all: float, mtime_best: float, kind: str) -> dcc.Graph:
+    """dcc.Graph dla pełnej serii z trainlogu (downsampling na serwerze)."""
+    uid = f"{run_name}:{kind}"
+    fig = _build_resampler_fig(run_name, mtime_all, mtime_best, kind)
+    _resampler_figs[uid] = fig
+
+    return dcc.Graph(id={"type": "resampled-graph", "index": uid}, figure=fig)
+
+# ─── 4) Layout dla pojedynczego runu ─────────────────────────────────
 def layout_for_run(run_name: str):
     run_folder = OUTPUT_DIR / run_name
     if not run_folder.exists() or not run_folder.is_dir():
@@ -26,7 +269,7 @@ def layout_for_run(run_name: str):
             dcc.Link("← Powrót do listy runów", href="/")
         ], style={"margin": "20px", "font-family": "Arial, sans-serif"})
 
-    # ─── 2.1) Tabela z konfiguracją (jeśli istnieje config.csv) ───────
+    # ─── 4.1) Tabela z konfiguracją (jeśli istnieje config.csv) ───────
     cfg_path = run_folder / "config.csv"
     config_table = None
     if cfg_path.exists():
@@ -39,46 +282,14 @@ def layout_for_run(run_name: str):
             style_cell={"textAlign": "left"}
         )
 
-    # ─── 2.2) Wczytanie logów: trainlog.csv i best_results.csv ────────
-    df_all  = pd.read_csv(run_folder / "trainlog.csv")
-    df_best = pd.read_csv(run_folder / "best_results.csv")
-
-    # ─── 2.3) Metryki globalne ────────────────────────────────────────
-    total_time_hours   = df_all["t"].sum() / 3600
-    total_best_success = int((df_best["Reward"] >= 50).sum())
-
-    # ─── 2.4) Dane blokowe (co 10 000 kroków) ────────────────────────
-    block_size = 10_000
-    df_all["Step_block"] = (df_all["Step"] // block_size) * block_size
+    # ─── 4.2) Wczytanie logów z cache'a (klucz: nazwa runu + mtime'y) ─
+    mtime_all  = _data_path(run_folder, "trainlog").stat().st_mtime
+    mtime_best = _data_path(run_folder, "best_results").stat().st_mtime
+    (_df_all, df_top, _avg_t_per_block, _successes_per_block,
+     _episodes_per_block,
+     total_time_hours, total_best_success) = load_run(run_name, mtime_all, mtime_best)
 
-    avg_t_per_block = (
-        df_all.groupby("Step_block")["t"]
-              .mean()
-              .reset_index(name="avg_t")
-    )
-
-    successes_per_block = (
-        df_all.assign(success=(df_all["Reward"] >= 50))
-              .groupby("Step_block")["success"]
-              .sum()
-              .reset_index(name="successes")
-    )
-
-    episodes_per_block = (
-        df_all.groupby("Step_block")["Episode"]
-              .nunique()
-              .reset_index(name="episodes")
-    )
-
-    metrics_block = pd.merge(successes_per_block, episodes_per_block, on="Step_block") \
-                     .melt(
-                         id_vars="Step_block",
-                         value_vars=["successes", "episodes"],
-                         var_name="metric",
-                         value_name="count"
-                     )
-
-    # ─── 2.5) Tworzymy listę elementów do umieszczenia na stronie runu ─
+    # ─── 4.3) Tworzymy listę elementów do umieszczenia na stronie runu ─
     components = []
 
     # Nagłówek + link powrotny
@@ -94,7 +305,7 @@ def layout_for_run(run_name: str):
         components.append(
             html.Details(
                 [
-                    html.Summary("⚙️ Parametry z plików .cfg", 
+                    html.Summary("⚙️ Parametry z plików .cfg",
                                  style={"font-weight": "bold", "cursor": "pointer"}),
                     config_table
                 ],
@@ -110,72 +321,46 @@ def layout_for_run(run_name: str):
         ], style={"margin": "20px", "font-family": "Arial, sans-serif"})
     )
 
-    # Wykres: Czas kroku (t) vs Step
-    fig_time = px.line(
-        df_all, x="Step", y="t",
-        title="Czas kroku (t) vs numer kroku",
-        labels={"t": "Czas [s]"}
-    )
-    components.append(dcc.Graph(figure=fig_time))
+    # Wykres: Czas kroku (t) vs Step (downsampling po stronie serwera)
+    components.append(resampled_graph(run_name, mtime_all, mtime_best, "time"))
 
-    # Wykres: Ret vs Step
-    fig_ret = px.line(
-        df_all, x="Step", y="Ret",
-        title="Ret w czasie",
-        labels={"Ret": "Return"}
-    )
-    components.append(dcc.Graph(figure=fig_ret))
+    # Wykres: Ret vs Step (downsampling po stronie serwera)
+    components.append(resampled_graph(run_name, mtime_all, mtime_best, "ret"))
 
     # Tabela: Top 100 rekordów (najwyższy Ret)
     components.append(html.H4("🏆 Top 100 rekordów (największy Ret)"))
     components.append(
         dash_table.DataTable(
-            columns=[{"name": c, "id": c} for c in df_best.columns],
-            data=df_best.nlargest(100, "Ret").to_dict("records"),
+            columns=[{"name": c, "id": c} for c in df_top.columns],
+            data=df_top.to_dict("records"),
             page_size=20,
             style_table={"overflowX": "auto", "margin": "10px 0"}
         )
     )
 
     # Wykres: Średni czas kroku per blok 10k
-    fig_avg_t_block = px.line(
-        avg_t_per_block,
-        x="Step_block", y="avg_t",
-        title=f"Średni czas kroku vs blok co {block_size} kroków",
-        labels={"Step_block": "Krok (blok)", "avg_t": "Średni czas [s]"},
-        markers=True
-    )
-    components.append(dcc.Graph(figure=fig_avg_t_block))
+    components.append(cached_graph(run_name, mtime_all, mtime_best, "avg_t_block"))
 
     # Wykres słupkowy: Sukcesy vs Epizody per blok 10k
-    fig_bar = px.bar(
-        metrics_block,
-        x="Step_block", y="count", color="metric",
-        barmode="group",
-        title="Sukcesy (Reward ≥100) vs Liczba Epizodów na blok 10 000 kroków",
-        labels={"Step_block": "Krok (blok)", "count": "Liczba", "metric": "Metryka"}
-    )
-    components.append(html.H4(f"Sukcesy i Epizody co {block_size} kroków"))
-    components.append(dcc.Graph(figure=fig_bar))
+    components.append(html.H4(f"Sukcesy i Epizody co {BLOCK_SIZE} kroków"))
+    components.append(cached_graph(run_name, mtime_all, mtime_best, "bar"))
 
     return html.Div(children=components, style={"font-family": "Arial, sans-serif"})
 
 
-# ─── 3) Aplikacja Dash z routingiem ───────────────────────────────────
-app = dash.Dash(__name__, suppress_callback_exceptions=True)
-
+# ─── 5) Layout główny aplikacji ──────────────────────────────────────
 app.layout = html.Div([
     dcc.Location(id="url", refresh=False),
+    # cache odwiedzonych stron runów w sessionStorage przeglądarki
+    dcc.Store(id="run-cache", storage_type="session"),
+    # pasek "ładowanie…" widoczny, gdy background callback buduje stronę
+    html.Div(id="page-loading"),
     html.Div(id="page-content")
 ])
 
 
-# ─── 4) Callback wyświetlający stronę główną lub odpowiedni run ─────────
-@app.callback(
-    Output("page-content", "children"),
-    Input("url", "pathname")
-)
-def display_page(pathname):
+# ─── 6) Callback wyświetlający stronę główną lub odpowiedni run ─────────
+def _page_layout(pathname):
     # ─ Strona główna "/": pokazujemy tabelkę z dwoma kolumnami
     if pathname == "/" or pathname == "":
         runs = list_runs()
@@ -240,5 +425,66 @@ def display_page(pathname):
     ], style={"margin": "20px", "font-family": "Arial, sans-serif"})
 
 
+# Strony runów odwiedzone w tej sesji wracają z sessionStorage bez
+# odpytywania serwera — serwer buduje layout tylko przy pierwszej wizycie.
+app.clientside_callback(
+    """
+    function(pathname, cached) {
+        if (cached && cached[pathname]) {
+            return cached[pathname];
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("page-content", "children", allow_duplicate=True),
+    Input("url", "pathname"),
+    State("run-cache", "data"),
+    prevent_initial_call=True,
+)
+
+
+@app.callback(
+    Output("page-content", "children"),
+    Output("run-cache", "data"),
+    Input("url", "pathname"),
+    State("run-cache", "data"),
+    background=True,
+    running=[
+        (Output("page-loading", "children"),
+         html.P("⏳ Wczytywanie danych runu…",
+                style={"margin": "20px", "font-family": "Arial, sans-serif"}),
+         ""),
+    ],
+)
+def display_page(pathname, run_cache):
+    run_cache = run_cache or {}
+    if run_cache.get(pathname) is not None:
+        # clientside callback już podmienił layout z cache'a sesji
+        raise dash.exceptions.PreventUpdate
+
+    layout = _page_layout(pathname)
+
+    # Cache'ujemy tylko strony runów — lista runów i 404 są tanie
+    if pathname and pathname.startswith("/run/"):
+        run_cache = {**run_cache, pathname: layout}
+
+    return layout, run_cache
+
+
+# ─── 7) Callback dociągający dane przy zoomie/panie (resampler) ──────
+@app.callback(
+    Output({"type": "resampled-graph", "index": MATCH}, "figure", allow_duplicate=True),
+    Input({"type": "resampled-graph", "index": MATCH}, "relayoutData"),
+    prevent_initial_call=True,
+)
+def update_resampled_graph(relayout_data):
+    uid = dash.ctx.triggered_id["index"]
+    fig = _get_resampler_fig(uid)
+    if fig is None or not relayout_data:
+        raise dash.exceptions.PreventUpdate
+    # dash.Patch z przeliczonym oknem — podmienia tylko dane śladów
+    return fig.construct_update_data_patch(relayout_data)
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,9 +1,22 @@
 # src/parse_log.py
 import re
-import csv
 import configparser
+import mmap
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# numba jest opcjonalna — bez niej redukcja best-per-episode działa
+# przez pandasowy idxmax
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 # ─── 0) Ścieżki bazowe ───────────────────────────────────────────────
 # Zakładamy, że uruchamiasz ten plik z katalogu "src/"
 DATA_DIR   = Path("../data")    # surowe logi, z podfolderami np. data/run1/
@@ -12,7 +25,7 @@ OUTPUT_DIR = Path("../output")  # tutaj stworzymy output/run1/, run2/, …
 OUTPUT_DIR.mkdir(exist_ok=True)
 
 # ─── 1) Regex do parsowania linii logów ──────────────────────────────
-pattern = re.compile(r"""
+PATTERN_SRC = r"""
     ^\s*
     .*? -\s+Iter:\s+(\d+)\s*/\s*(\d+)\s+      # 1=Step  2=Episode
     ([A-Z][0-9]-[A-Z][0-9])\s+ -\s+           # 3=Decision
@@ -24,114 +37,205 @@ pattern = re.compile(r"""
     \s+SF\s*=\s*([+-]?\d+(?:\.\d+)?)              # 9=SF
     \s+Seen=\s*([01])                             # 10=Found (0 lub 1)
     \s+Reward:\s*([+-]?\d+(?:\.\d+)?)             # 11=Reward
-""", re.VERBOSE)
+"""
+
 
 HEADER = [
     "Step", "Episode", "Decision", "Eps", "lr",
     "Ret", "Last Crash", "t", "SF", "Found", "Reward"
 ]
 
+# próg sukcesu używany przez dashboard (kolumna "success" liczona tutaj,
+# żeby dashboard nie ewaluował predykatu przy każdym renderze)
+SUCCESS_THRESHOLD = 50
+
+# Docelowe typy kolumn numerycznych (regex zwraca same stringi).
+# 32 bity w zupełności wystarczają na kroki i nagrody, a połowa szerokości
+# to połowa bajtów do przeczytania przy każdej agregacji w dashboardzie.
+NUMERIC_DTYPES = {
+    "Step": "int32", "Episode": "int32", "Eps": "float32", "lr": "float32",
+    "Ret": "float32", "Last Crash": "int32", "t": "float32", "SF": "float32",
+    "Reward": "float32",
+}
+
+
+# wzorzec bajtowy do skanu całego zmapowanego bufora — ^ działa na
+# początkach linii dzięki MULTILINE, więc dzielenie na linie odpada
+pattern_bytes = re.compile(PATTERN_SRC.encode("ascii"),
+                           re.VERBOSE | re.MULTILINE)
+
+
+def _extract_file(txt_file: Path) -> pd.DataFrame:
+    """
+    Jeden plik .txt → ramka stringów wg HEADER. Plik jest mmapowany
+    i skanowany jednym findall po całym buforze, bez iteracji po liniach
+    i bez dekodowania całości do str — strony pliku idą prosto z cache'a
+    systemu do silnika regex.
+    """
+    if txt_file.stat().st_size == 0:
+        return pd.DataFrame(columns=HEADER, dtype="string")
+
+    with txt_file.open("rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            matches = pattern_bytes.findall(mm)
+
+    if not matches:
+        return pd.DataFrame(columns=HEADER, dtype="string")
+
+    df = pd.DataFrame(matches, columns=HEADER)
+    # grupy to bajty ASCII — dekodujemy raz, wektorowo, per kolumna
+    for name in HEADER:
+        df[name] = df[name].str.decode("ascii")
+    return df
+
+
+def _typed_columns(raw: pd.DataFrame) -> dict:
+    """
+    Ramka stringów z regexa → słownik stypowanych, ciągłych tablic (SoA).
+    Wiersze nigdy nie materializują się jako krotki: każda kolumna od razu
+    ląduje we własnej tablicy, którą pyarrow i pandas przejmują bez kopii.
+    """
+    cols = {}
+    for name in HEADER:
+        if name in NUMERIC_DTYPES:
+            cols[name] = raw[name].astype(NUMERIC_DTYPES[name]).to_numpy()
+        elif name == "Found":
+            cols[name] = raw[name].astype("int8").astype(bool).to_numpy()
+        else:  # Decision — jedyna kolumna tekstowa
+            cols[name] = raw[name].to_numpy()
+    return cols
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _best_idx_kernel(codes, rets, n_groups):
+        """Pozycja wiersza z najwyższym Ret dla każdej grupy (kod epizodu)."""
+        best_ret = np.full(n_groups, -np.inf)
+        best_idx = np.zeros(n_groups, np.int64)
+        for i in range(codes.shape[0]):
+            c = codes[i]
+            if rets[i] > best_ret[c]:
+                best_ret[c] = rets[i]
+                best_idx[c] = i
+        return best_idx
+
+
+def _best_indices(df_all: pd.DataFrame):
+    """
+    Pozycje wierszy z najlepszym Ret per Episode. Z numbą: natywna pętla
+    po stypowanych tablicach (kody epizodów + float Ret); bez numby:
+    groupby-idxmax. Obie wersje przy remisie zostawiają pierwszy wiersz.
+    """
+    if njit is None:
+        return df_all.groupby("Episode", sort=False)["Ret"].idxmax().to_numpy()
+    codes, uniques = pd.factorize(df_all["Episode"].to_numpy())
+    return _best_idx_kernel(codes, df_all["Ret"].to_numpy(), len(uniques))
+
+
+def _write_outputs(df: pd.DataFrame, pq_path: Path, csv_path: Path):
+    """Zapis kolumnowy do parquet (zstd) + CSV jako eksport pomocniczy."""
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False),
+                   pq_path, compression="zstd")
+    df.to_csv(csv_path, index=False)
+
 
 def parse_one_run(run_name: str, run_input_dir: Path, run_output_dir: Path):
     """
     Parsuje wszystkie *.txt w katalogu run_input_dir → tworzy:
-      - run_output_dir/trainlog.csv
-      - run_output_dir/best_results.csv
+      - run_output_dir/trainlog.parquet  (+ trainlog.csv jako eksport)
+      - run_output_dir/best_results.parquet  (+ best_results.csv)
       - run_output_dir/config.csv  (parametry z plików .cfg)
     """
     print(f">>> Rozpoczynam parsowanie runu '{run_name}' …")
     run_output_dir.mkdir(exist_ok=True, parents=True)
 
-    # ─── 1a) Parsowanie logów do trainlog.csv i best_results.csv ─────────
-    csv_all_path  = run_output_dir / "trainlog.csv"
-    csv_best_path = run_output_dir / "best_results.csv"
-
-    best_by_episode = {}
-    total, parsed = 0, 0
-
-    with csv_all_path.open("w", newline="", encoding="utf-8") as f_all:
-        writer_all = csv.writer(f_all)
-        writer_all.writerow(HEADER)
-
-        # dla każdego pliku .txt w katalogu run_input_dir
-        for txt_file in run_input_dir.glob("*.txt"):
-            with txt_file.open(encoding="utf-8") as f_in:
-                for line in f_in:
-                    total += 1
-                    m = pattern.match(line)
-                    if not m:
-                        continue
-                    row = list(m.groups())
-                    # konwersja pola "Found" z '0'/'1' do boolean
-                    row[9] = bool(int(row[9]))
-                    writer_all.writerow(row)
-                    parsed += 1
-
-                    ep = row[1]
-                    ret_val = float(row[5])
-                    # jeśli pierwszy raz lub Ret większy → aktualizujemy best_by_episode
-                    if (ep not in best_by_episode) or (ret_val > best_by_episode[ep][0]):
-                        best_by_episode[ep] = (ret_val, row)
-
-    # Zapis najlepszych per Episode
-    with csv_best_path.open("w", newline="", encoding="utf-8") as f_best:
-        writer_best = csv.writer(f_best)
-        writer_best.writerow(HEADER)
-        # sortujemy po numerze ep (transformacja do int)
-        for ep, (ret_val, row) in sorted(best_by_episode.items(), key=lambda kv: int(kv[0])):
-            writer_best.writerow(row)
-
-    print(f"    • Zapisano '{csv_all_path.name}' ({parsed}/{total} wierszy).")
-    print(f"    • Zapisano '{csv_best_path.name}' (best per Episode).")
+    # ─── 1a) Parsowanie logów do trainlog i best_results ─────────────────
+    txt_files = list(run_input_dir.glob("*.txt"))
+    frames = [_extract_file(txt_file) for txt_file in txt_files]
+
+    raw = (pd.concat(frames, ignore_index=True)
+           if frames else pd.DataFrame(columns=HEADER, dtype="string"))
+    cols = _typed_columns(raw)
+    cols["success"] = (cols["Reward"] >= SUCCESS_THRESHOLD).astype(np.int8)
+
+    # parquet pisany prosto ze słownika kolumn; DataFrame dla CSV i dalszej
+    # obróbki to tylko widoki na te same tablice
+    pq.write_table(pa.table(cols),
+                   run_output_dir / "trainlog.parquet", compression="zstd")
+    df_all = pd.DataFrame(cols)
+    df_all.to_csv(run_output_dir / "trainlog.csv", index=False)
+
+    # Najlepszy wynik per Episode (redukcja natywna lub idxmax)
+    if len(df_all):
+        df_best = df_all.iloc[_best_indices(df_all)].sort_values("Episode")
+    else:
+        df_best = df_all
+    _write_outputs(df_best,
+                   run_output_dir / "best_results.parquet",
+                   run_output_dir / "best_results.csv")
+
+    # Top 100 po Ret — sortujemy raz na etapie parsowania, żeby dashboard
+    # nie robił nlargest na best_results przy każdej nawigacji
+    df_top = df_best.nlargest(100, "Ret")
+    _write_outputs(df_top,
+                   run_output_dir / "top100.parquet",
+                   run_output_dir / "top100.csv")
+
+    print(f"    • Zapisano 'trainlog.parquet' "
+          f"({len(df_all)} wierszy z {len(txt_files)} plików .txt).")
+    print(f"    • Zapisano 'best_results.parquet' (best per Episode).")
 
     # ─── 1b) Parsowanie wszystkich plików .cfg → config.csv ──────────────
-    config_params = {}  # słownik param → wartość, np. "general_params.run_name"→"Tello_indoor"
-
-    # Szukamy plików o rozszerzeniu .cfg w run_input_dir
-    for cfg_file in run_input_dir.glob("*.cfg"):
-        # używamy ConfigParser, by pominąć linie komentarzy # lub ;
+    cfg_files = sorted(run_input_dir.glob("*.cfg"))
+    if not cfg_files:
+        print("    • Nie znaleziono plików .cfg w tym runie.")
+    else:
+        # jeden ConfigParser wczytuje i scala wszystkie pliki naraz —
+        # komentarze # i ; pomija sam parser, a przy powtórzonych kluczach
+        # wygrywa późniejszy plik (deterministycznie, bo lista posortowana)
         parser = configparser.ConfigParser()
-        # wymuszamy ignorowanie wielkości liter w nazwach kluczy (jeśli ktoś czasem użyje innego stylu)
-        parser.optionxform = str  
-
-        parser.read(cfg_file, encoding="utf-8")
-        for section in parser.sections():
-            for key, val in parser.items(section):
-                # wskutek mapowania na lower-case klucze są w jednakowym formacie
-                param_name = f"{section}.{key}"
-                config_params[param_name] = val
-
-    # Jeżeli znaleziono jakiekolwiek parametry, zapiszemy je do CSV
-    if config_params:
+        parser.optionxform = str  # nie zmieniamy wielkości liter w kluczach
+        parser.read(cfg_files, encoding="utf-8")
+
+        # spłaszczamy do "sekcja.klucz" → wartość, np.
+        # "general_params.run_name" → "Tello_indoor"
+        config_params = {
+            f"{section}.{key}": val
+            for section in parser.sections()
+            for key, val in parser.items(section)
+        }
+
         csv_cfg_path = run_output_dir / "config.csv"
-        with csv_cfg_path.open("w", newline="", encoding="utf-8") as f_cfg:
-            writer_cfg = csv.writer(f_cfg)
-            writer_cfg.writerow(["parameter", "value"])
-            # sortujemy po nazwie parametru, dla czytelności
-            for param, value in sorted(config_params.items()):
-                writer_cfg.writerow([param, value])
+        pd.DataFrame(sorted(config_params.items()),
+                     columns=["parameter", "value"]).to_csv(csv_cfg_path, index=False)
         print(f"    • Zapisano '{csv_cfg_path.name}' ({len(config_params)} parametrów).")
-    else:
-        print("    • Nie znaleziono plików .cfg w tym runie.")
 
     print(f"<<< Zakończono parsowanie runu '{run_name}'.\n")
 
 
 def main():
     """
-    Przechodzimy rekurencyjnie po każdym podfolderze w 'data/'.
-    Dla każdego tworzymy odpowiednik w 'output/' i wywołujemy parse_one_run.
+    Przechodzimy po każdym podfolderze w 'data/'. Runy są od siebie
+    niezależne, więc parsujemy je równolegle na puli procesów — każdy
+    worker dostaje jeden run i zapisuje swoje pliki wynikowe.
     """
     if not DATA_DIR.exists() or not DATA_DIR.is_dir():
         print(f"Błąd: nie znaleziono katalogu {DATA_DIR}. Włóż tam swoje runy (podfoldery).")
         return
 
-    for run_dir in sorted(DATA_DIR.iterdir()):
-        if not run_dir.is_dir():
-            continue
-        run_name     = run_dir.name
-        out_run_dir  = OUTPUT_DIR / run_name
-        parse_one_run(run_name, run_dir, out_run_dir)
+    run_dirs = [d for d in sorted(DATA_DIR.iterdir()) if d.is_dir()]
+    if not run_dirs:
+        print(f"Brak podfolderów z runami w {DATA_DIR}.")
+        return
+
+    with ProcessPoolExecutor() as executor:
+        futures = [
+            executor.submit(parse_one_run, run_dir.name, run_dir, OUTPUT_DIR / run_dir.name)
+            for run_dir in run_dirs
+        ]
+        # .result() propaguje ewentualne wyjątki z workerów
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":